@@ -22,15 +22,58 @@
 
 import os
 import sys
+import operator
+import functools
 
-from hypothesis.strategies import composite, one_of, characters, \
-    text, permutations, builds, lists, sampled_from, just
+from hypothesis.strategies import one_of, characters, text, \
+    builds, lists, sampled_from, just, randoms, tuples, deferred
 from hypothesis.errors import InvalidArgument
 
 text_type = type(u"")
 PY3 = (sys.version_info[0] == 3)
 defines_strategy = lambda x: x
 
+_IS_NT = (os.name == 'nt')
+_HAS_PATHLIKE = hasattr(os, 'PathLike')
+_HAS_FSPATH = hasattr(os, 'fspath')
+
+_SEP = os.sep
+_ALTSEP = os.altsep or os.sep
+_CURDIR = os.curdir
+_PARDIR = os.pardir
+_EXTSEP = os.extsep
+
+_FS_ENCODING = sys.getfilesystemencoding()
+_FS_ERRORS = 'surrogateescape' if PY3 else 'ignore'
+
+
+def _refresh_fs_encoding():
+    """Re-reads the filesystem encoding, in case it was changed after import
+    (e.g. through sys._enablelegacywindowsfsencoding())
+    """
+
+    global _FS_ENCODING
+    _FS_ENCODING = sys.getfilesystemencoding()
+
+
+def _cached(func):
+    """Caches the return value of func per positional arguments.
+
+    Used for functions building strategies, so each strategy only gets
+    created once.
+    """
+
+    cache = {}
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        try:
+            return cache[args]
+        except KeyError:
+            return cache.setdefault(args, func(*args))
+
+    return wrapper
+
 
 class _PathLike(object):
     """A class implementing the os.PathLike protocol available since Python
@@ -39,9 +82,14 @@ class _PathLike(object):
     See https://www.python.org/dev/peps/pep-0519/ for more details.
     """
 
+    __slots__ = ('_value',)
+
     def __init__(self, value):
         self._value = value
 
+    def __reduce__(self):
+        return (self.__class__, (self._value,))
+
     def __fspath__(self):
         return self._value
 
@@ -49,116 +97,194 @@ class _PathLike(object):
         return 'pathlike(%r)' % self._value
 
 
-@composite
-def _filename(draw, result_type=None):
-    """Generate a path value of type result_type.
+_STR_TO_PATH = {
+    (bytes, text_type): lambda s: s.decode('ascii'),
+    (text_type, bytes): lambda s: s.encode('ascii'),
+}
+
+
+def _str_to_path(s, result_type):
+    """Given an ASCII str, returns a path of the given type."""
+
+    assert isinstance(s, str)
+    convert = _STR_TO_PATH.get((type(s), result_type))
+    if convert is None:
+        return s
+    return convert(s)
+
+
+# The strategies below don't depend on any arguments, so build them only once
+# at import time instead of on every draw.
+
+# Various ASCII chars have a special meaning for the operating system,
+# so make them more common
+_ASCII_CHAR = characters(min_codepoint=0x01, max_codepoint=0x7f)
+
+if _IS_NT:  # pragma: no cover
+    def _text_to_bytes(path):
+        try:
+            return path.encode(_FS_ENCODING, 'surrogatepass')
+        except UnicodeEncodeError:
+            return path.encode(_FS_ENCODING, 'replace')
+
+    # Windows paths can contain all surrogates and even surrogate pairs
+    # if two paths are concatenated. This makes it more likely for them to
+    # be generated.
+    _ALPHABET = one_of(
+        characters(min_codepoint=0x1),
+        characters(min_codepoint=0xD800, max_codepoint=0xDFFF),
+        _ASCII_CHAR)
+    _TEXT_FROM_ALPHABET = text(alphabet=_ALPHABET)
+
+    _WINDOWS_PATH_TEXT = _TEXT_FROM_ALPHABET
+    _WINDOWS_PATH_BYTES = _TEXT_FROM_ALPHABET.map(_text_to_bytes)
+
+    _FILENAME = {
+        bytes: _WINDOWS_PATH_BYTES,
+        text_type: _WINDOWS_PATH_TEXT,
+    }
+else:
+    def _latin1_to_fs_text(t):
+        # encode and decode in one step instead of mapping twice
+        return t.encode('latin-1').decode(_FS_ENCODING, _FS_ERRORS)
+
+    _ALPHABET = one_of(
+        characters(min_codepoint=0x01, max_codepoint=0xff), _ASCII_CHAR)
+    _TEXT_FROM_ALPHABET = text(alphabet=_ALPHABET)
+
+    _UNIX_PATH_BYTES = _TEXT_FROM_ALPHABET.map(
+        operator.methodcaller('encode', 'latin-1'))
+    _UNIX_PATH_TEXT = _TEXT_FROM_ALPHABET.map(_latin1_to_fs_text)
+
+    def _shuffle_text(rng, t):
+        # nothing to shuffle, skip the list round trip
+        if len(t) < 2:
+            return t
+        chars = list(t)
+        rng.shuffle(chars)
+        return u"".join(chars)
+
+    # Two surrogates generated through surrogateescape can generate
+    # a valid utf-8 sequence when encoded and result in a different
+    # code point when decoded again. Can happen when two paths get
+    # concatenated. Shuffling makes it possible to generate such a case.
+    _FILENAME = {
+        bytes: _UNIX_PATH_BYTES,
+        text_type: builds(_shuffle_text, randoms(), _UNIX_PATH_TEXT),
+    }
+
+_JOIN = {
+    bytes: b"".join,
+    text_type: u"".join,
+}
+
+_JUST_EMPTY = {
+    bytes: just(b""),
+    text_type: just(u""),
+}
+
+_SEP_STRATEGY = {
+    bytes: sampled_from(
+        [_str_to_path(_SEP, bytes), _str_to_path(_ALTSEP, bytes)]),
+    text_type: sampled_from(
+        [_str_to_path(_SEP, text_type), _str_to_path(_ALTSEP, text_type)]),
+}
+
+
+def _filename(result_type):
+    """Returns a strategy generating a path component of type result_type.
 
     result_type can either be bytes or text_type
 
     """
-    # Various ASCII chars have a special meaning for the operating system,
-    # so make them more common
-    ascii_char = characters(min_codepoint=0x01, max_codepoint=0x7f)
-    if os.name == 'nt':  # pragma: no cover
-        # Windows paths can contain all surrogates and even surrogate pairs
-        # if two paths are concatenated. This makes it more likely for them to
-        # be generated.
-        surrogate = characters(
-            min_codepoint=0xD800, max_codepoint=0xDFFF)
-        uni_char = characters(min_codepoint=0x1)
-        text_strategy = text(
-            alphabet=one_of(uni_char, surrogate, ascii_char))
-
-        def text_to_bytes(path):
-            fs_enc = sys.getfilesystemencoding()
-            try:
-                return path.encode(fs_enc, 'surrogatepass')
-            except UnicodeEncodeError:
-                return path.encode(fs_enc, 'replace')
-
-        bytes_strategy = text_strategy.map(text_to_bytes)
-    else:
-        latin_char = characters(min_codepoint=0x01, max_codepoint=0xff)
-        bytes_strategy = text(alphabet=one_of(latin_char, ascii_char)).map(
-            lambda t: t.encode('latin-1'))
-
-        unix_path_text = bytes_strategy.map(
-            lambda b: b.decode(
-                sys.getfilesystemencoding(),
-                'surrogateescape' if PY3 else 'ignore'))
-
-        # Two surrogates generated through surrogateescape can generate
-        # a valid utf-8 sequence when encoded and result in a different
-        # code point when decoded again. Can happen when two paths get
-        # concatenated. Shuffling makes it possible to generate such a case.
-        text_strategy = permutations(draw(unix_path_text)).map(u"".join)
-
-    if result_type is None:
-        return draw(one_of(bytes_strategy, text_strategy))
-    elif result_type is bytes:
-        return draw(bytes_strategy)
-    else:
-        return draw(text_strategy)
 
+    return _FILENAME[result_type]
 
-def _str_to_path(s, result_type):
-    """Given an ASCII str, returns a path of the given type."""
 
-    assert isinstance(s, str)
-    if isinstance(s, bytes) and result_type is text_type:
-        return s.decode('ascii')
-    elif isinstance(s, text_type) and result_type is bytes:
-        return s.encode('ascii')
-    return s
+@_cached
+def _path_root_posix(result_type):
+    """Returns a strategy generating a root component for a POSIX path."""
 
+    return just(_str_to_path(_SEP, result_type))
 
-@composite
-def _path_root(draw, result_type):
-    """Generates a root component for a path."""
+
+@_cached
+def _path_root_nt(result_type):
+    """Returns a strategy generating a root component for a Windows path."""
 
     # Based on https://en.wikipedia.org/wiki/Path_(computing)
 
     def tp(s=''):
         return _str_to_path(s, result_type)
 
-    if os.name != 'nt':
-        return tp(os.sep)
-
-    sep = sampled_from([os.sep, os.altsep or os.sep]).map(tp)
+    sep = _SEP_STRATEGY[result_type]
     name = _filename(result_type)
     char = characters(min_codepoint=ord("A"), max_codepoint=ord("z")).map(
         lambda c: tp(str(c)))
 
+    join = _JOIN[result_type]
+
     relative = sep
     # [drive_letter]:\
-    drive = builds(lambda *x: tp().join(x), char, just(tp(':')), sep)
+    drive = tuples(char, just(tp(':')), sep).map(join)
     # \\?\[drive_spec]:\
-    extended = builds(
-        lambda *x: tp().join(x), sep, sep, just(tp('?')), sep, drive)
+    extended = tuples(
+        sep, sep, just(tp('?')), sep, char, just(tp(':')), sep).map(join)
 
     network = one_of([
         # \\[server]\[sharename]\
-        builds(lambda *x: tp().join(x), sep, sep, name, sep, name, sep),
+        tuples(sep, sep, name, sep, name, sep).map(join),
         # \\?\[server]\[sharename]\
-        builds(lambda *x: tp().join(x),
-               sep, sep, just(tp('?')), sep, name, sep, name, sep),
+        tuples(sep, sep, just(tp('?')), sep, name, sep, name, sep).map(join),
         # \\?\UNC\[server]\[sharename]\
-        builds(lambda *x: tp().join(x),
-               sep, sep, just(tp('?')), sep, just(tp('UNC')), sep, name, sep,
-               name, sep),
+        tuples(sep, sep, just(tp('?')), sep, just(tp('UNC')), sep, name, sep,
+               name, sep).map(join),
         # \\.\[physical_device]\
-        builds(lambda *x: tp().join(x),
-               sep, sep, just(tp('.')), sep, name, sep),
+        tuples(sep, sep, just(tp('.')), sep, name, sep).map(join),
     ])
 
-    final = one_of(relative, drive, extended, network)
+    return one_of(relative, drive, extended, network)
 
-    return draw(final)
+
+_path_root = _path_root_nt if _IS_NT else _path_root_posix
+
+
+@_cached
+def _build_fspaths(result_type):
+    """Returns a strategy generating path values of type result_type."""
+
+    def tp(s=''):
+        return _str_to_path(s, result_type)
+
+    special_component = sampled_from([tp(_CURDIR), tp(_PARDIR)])
+    normal_component = _filename(result_type)
+    path_component = one_of(normal_component, special_component)
+    extsep = tp(_EXTSEP)
+    extension = normal_component.map(lambda f: extsep + f)
+    root = _path_root(result_type)
+    empty = _JUST_EMPTY[result_type]
+
+    sep = _SEP_STRATEGY[result_type]
+    path_part = builds(lambda s, l: s.join(l), sep, lists(path_component))
+    return tuples(
+        one_of(root, empty), path_part, one_of(extension, empty)).map(
+            _JOIN[result_type])
+
+
+@_cached
+def _fspaths_strategy(with_pathlike):
+    """Returns a strategy generating path values of all types, optionally
+    including pathlike objects.
+    """
+
+    main_strategy = one_of(_build_fspaths(bytes), _build_fspaths(text_type))
+    if not with_pathlike:
+        return main_strategy
+    return one_of(main_strategy, main_strategy.map(_PathLike))
 
 
 @defines_strategy
-@composite
-def fspaths(draw, allow_pathlike=None):
+def fspaths(allow_pathlike=None):
     """A strategy which generates filesystem path values.
 
     The generated values include everything which the builtin
@@ -180,36 +306,17 @@ def fspaths(draw, allow_pathlike=None):
     .. versionadded:: 3.15
 
     """
-    has_pathlike = hasattr(os, 'PathLike')
-
-    if allow_pathlike is None:
-        allow_pathlike = has_pathlike
-    if allow_pathlike and not has_pathlike:
-        raise InvalidArgument(
-            'allow_pathlike: os.PathLike not supported, use None instead '
-            'to enable it only when available')
-
-    result_type = draw(sampled_from([bytes, text_type]))
-
-    def tp(s=''):
-        return _str_to_path(s, result_type)
 
-    special_component = sampled_from([tp(os.curdir), tp(os.pardir)])
-    normal_component = _filename(result_type)
-    path_component = one_of(normal_component, special_component)
-    extension = normal_component.map(lambda f: tp(os.extsep) + f)
-    root = _path_root(result_type)
-
-    def optional(st):
-        return one_of(st, just(result_type()))
-
-    sep = sampled_from([os.sep, os.altsep or os.sep]).map(tp)
-    path_part = builds(lambda s, l: s.join(l), sep, lists(path_component))
-    main_strategy = builds(lambda *x: tp().join(x),
-                           optional(root), path_part, optional(extension))
+    def build():
+        with_pathlike = allow_pathlike
+        if with_pathlike is None:
+            with_pathlike = _HAS_PATHLIKE
+        if with_pathlike and not _HAS_PATHLIKE:
+            raise InvalidArgument(
+                'allow_pathlike: os.PathLike not supported, use None instead '
+                'to enable it only when available')
 
-    if allow_pathlike and hasattr(os, 'fspath'):
-        pathlike_strategy = main_strategy.map(lambda p: _PathLike(p))
-        main_strategy = one_of(main_strategy, pathlike_strategy)
+        return _fspaths_strategy(bool(with_pathlike and _HAS_FSPATH))
 
-    return draw(main_strategy)
+    # Defer the argument check to the first draw, like with a composite
+    return deferred(build)
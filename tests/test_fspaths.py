@@ -25,25 +25,50 @@ import io
 import os
 import sys
 import codecs
+import pickle
+import shutil
 import tempfile
 
 import pytest
 
-from hypothesis import given
-from hypothesis_fspaths import fspaths
-from hypothesis.errors import InvalidArgument
+from hypothesis import given, find, settings, Phase
+import hypothesis_fspaths
+from hypothesis_fspaths import fspaths, _filename, _path_root, \
+    _build_fspaths, _fspaths_strategy, _refresh_fs_encoding, _PathLike
+from hypothesis.errors import InvalidArgument, NoSuchExample
 
 text_type = type(u'')
 PY3 = (sys.version_info[0] == 3)
 encoding = sys.getfilesystemencoding()
 is_win = (os.name == 'nt')
+_PATH_TYPES = (bytes, text_type)
+
+
+def _assert_covers(strategy, predicates):
+    """Asserts that for each predicate the strategy generates a value
+    satisfying it, using a single search for all of them.
+    """
+
+    remaining = list(predicates)
+
+    def covers_all(value):
+        remaining[:] = [p for p in remaining if not p(value)]
+        return not remaining
+
+    # The predicate result depends on the values seen before, so only
+    # generate and stop at the first hit, without shrinking or replaying.
+    try:
+        find(strategy, covers_all, settings=settings(
+            max_examples=2000, database=None, phases=[Phase.generate]))
+    except NoSuchExample:
+        pass
+    assert not remaining, remaining
 
 
 def test_path_property_examples():
-    if is_win:
-        fspaths(allow_pathlike=False).filter(
-            lambda p: os.path.normcase(p) != p).example()
+    predicates = []
 
+    if is_win:
         def is_valid_ascii_drive(p):
             if os.path.splitunc(p)[0]:
                 return False
@@ -54,21 +79,23 @@ def test_path_property_examples():
 
             return ord("A") <= ord(drive[0:1]) <= ord("z")
 
-        fspaths(allow_pathlike=False).filter(is_valid_ascii_drive).example()
+        predicates += [
+            lambda p: os.path.normcase(p) != p,
+            is_valid_ascii_drive,
+            lambda p: os.path.splitunc(p)[0],
+        ]
 
-        fspaths(allow_pathlike=False).filter(
-            lambda p: os.path.splitunc(p)[0]).example()
+    predicates += [
+        lambda p: p and os.path.normpath(p) != p,
+        lambda p: os.path.splitext(p)[1],
+        lambda p: os.path.basename(p) == p,
+        os.path.isabs,
+        os.path.dirname,
+        os.path.basename,
+        os.path.abspath,
+    ]
 
-    fspaths(allow_pathlike=False).filter(
-        lambda p: p and os.path.normpath(p) != p).example()
-    fspaths(allow_pathlike=False).filter(
-        lambda p: os.path.splitext(p)[1]).example()
-    fspaths(allow_pathlike=False).filter(
-        lambda p: os.path.basename(p) == p).example()
-    fspaths(allow_pathlike=False).filter(os.path.isabs).example()
-    fspaths(allow_pathlike=False).filter(os.path.dirname).example()
-    fspaths(allow_pathlike=False).filter(os.path.basename).example()
-    fspaths(allow_pathlike=False).filter(os.path.abspath).example()
+    _assert_covers(fspaths(allow_pathlike=False), predicates)
 
 
 def norm_encoding(name):
@@ -77,38 +104,35 @@ def norm_encoding(name):
     return codecs.lookup(name).name
 
 
-def single_byte_full_encoding(encoding):
-    """Whether the encoding can decode all byte values (e.g. latin1)"""
+if PY3:
+    _ALL_BYTES = bytes(range(256))
+else:
+    _ALL_BYTES = b''.join(map(chr, range(256)))
 
-    if PY3:
-        bytes_ = map(lambda i: bytes([i]), range(0, 256))
-    else:
-        bytes_ = map(chr, range(0, 256))
 
-    for byte in bytes_:
-        try:
-            byte.decode(encoding)
-        except UnicodeDecodeError:
-            return False
-    return True
+def single_byte_full_encoding(encoding):
+    """Whether the encoding can decode all byte values (e.g. latin1)"""
 
+    # Decode all values at once. A multi-byte encoding could combine
+    # neighbouring bytes, so also make sure each byte got its own char.
+    decoded = _ALL_BYTES.decode(encoding, 'replace')
+    return (len(decoded) == len(_ALL_BYTES) and u'\ufffd' not in decoded)
 
-def fspath(p):
-    """Like os.fspath but for Python <= 3.6."""
 
-    try:
-        return os.fspath(p)
-    except AttributeError:
-        return p
+# Like os.fspath but for Python <= 3.6
+fspath = getattr(os, 'fspath', lambda p: p)
 
 
-@pytest.fixture(scope='module')
+@pytest.fixture(scope='session')
 def tempdir_path():
     dir_ = tempfile.mkdtemp()
+    str_prefix = dir_ + os.sep
+    bytes_prefix = os.fsencode(str_prefix) if PY3 else str_prefix
     try:
-        yield dir_
+        yield (str_prefix, bytes_prefix)
     finally:
-        os.rmdir(dir_)
+        # also clean up in case a test left something behind
+        shutil.rmtree(dir_)
 
 
 @given(fspaths())
@@ -120,9 +144,10 @@ def test_path_join(path):
 def test_open(tempdir_path, path):
     # To prevent side effects, only access a path in a temp directory we have
     # created
-    if PY3 and isinstance(path, bytes):
-        tempdir_path = os.fsencode(tempdir_path)
-    path = os.path.join(tempdir_path, path)
+    # basename() never contains a separator or drive, so prepending the
+    # directory is the same as os.path.join()
+    str_prefix, bytes_prefix = tempdir_path
+    path = (bytes_prefix if isinstance(path, bytes) else str_prefix) + path
 
     # The value range of fspaths() is limited by what open() accepts
     try:
@@ -131,16 +156,18 @@ def test_open(tempdir_path, path):
     except IOError:
         pass
 
-    try:
-        with io.open(path):
+    # On Python 3 open() is io.open()
+    if not PY3:
+        try:
+            with io.open(path):
+                pass
+        except IOError:
             pass
-    except IOError:
-        pass
 
 
 @given(fspaths(allow_pathlike=False))
 def test_allow_pathlike_false(path):
-    assert isinstance(path, (bytes, text_type))
+    assert isinstance(path, _PATH_TYPES)
 
 
 def test_allow_pathlike_fail_when_not_available():
@@ -149,132 +176,244 @@ def test_allow_pathlike_fail_when_not_available():
             fspaths(allow_pathlike=True).example()
 
 
+def test_allow_pathlike_fails_on_draw(monkeypatch):
+    monkeypatch.setattr('hypothesis_fspaths._HAS_PATHLIKE', False)
+    # creating the strategy is fine, only drawing from it fails
+    strategy = fspaths(allow_pathlike=True)
+    with pytest.raises(InvalidArgument):
+        strategy.example()
+
+
+@pytest.mark.skipif(is_win, reason='Unix only')
+def test_refresh_fs_encoding(monkeypatch):
+    monkeypatch.setattr(sys, 'getfilesystemencoding', lambda: 'latin-1')
+    try:
+        _refresh_fs_encoding()
+        assert hypothesis_fspaths._FS_ENCODING == 'latin-1'
+
+        # latin-1 decodes all bytes, so no surrogates get escaped anymore
+        @given(_filename(text_type))
+        def check(path):
+            path.encode('latin-1')
+
+        check()
+    finally:
+        monkeypatch.undo()
+        _refresh_fs_encoding()
+
+    assert hypothesis_fspaths._FS_ENCODING == encoding
+
+
+def test_strategies_are_reused():
+    for result_type in (bytes, text_type):
+        assert _filename(result_type) is _filename(result_type)
+        assert _path_root(result_type) is _path_root(result_type)
+        assert _build_fspaths(result_type) is _build_fspaths(result_type)
+    for with_pathlike in (False, True):
+        assert _fspaths_strategy(with_pathlike) is \
+            _fspaths_strategy(with_pathlike)
+
+
 def test_example_basic():
-    fspaths().filter(lambda p: not fspath(p)).example()
-    fspaths().filter(
-        lambda p: len(fspath(p)) > 20).example()
+    _assert_covers(fspaths(), [
+        lambda p: not fspath(p),
+        lambda p: len(fspath(p)) > 20,
+    ])
 
 
 def test_example_types():
 
     def is_bytes(p):
-        p = fspath(p)
+        if not isinstance(p, _PATH_TYPES):
+            p = fspath(p)
         return isinstance(p, bytes)
 
-    fspaths().filter(is_bytes).example()
-
     def is_text(p):
-        p = fspath(p)
+        if not isinstance(p, _PATH_TYPES):
+            p = fspath(p)
         return isinstance(p, text_type)
 
-    fspaths().filter(is_text).example()
+    _assert_covers(fspaths(), [is_bytes, is_text])
 
     def is_pathlike(p):
         # there should be values implementing os.PathLike
-        if isinstance(p, (bytes, text_type)):
+        if isinstance(p, _PATH_TYPES):
             return False
         os.fspath(p)
         return True
 
     if hasattr(os, 'PathLike'):
-        value = fspaths().filter(is_pathlike).example()
+        value = find(fspaths(), is_pathlike)
         assert repr(value) == 'pathlike(%r)' % os.fspath(value)
 
 
-@pytest.mark.skipif(is_win or not PY3, reason='PY3+Unix only')
-def test_find_text_with_surrogateescape():
-    # Python 3 str paths on Unix should contain surrogates due to the
-    # surrogateescape handler at some point
+def test_pathlike_pickle():
+    for value in [b'x', u'x']:
+        pathlike = _PathLike(value)
+        for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(pathlike, proto))
+            assert type(loaded) is _PathLike
+            if hasattr(os, 'fspath'):
+                assert os.fspath(loaded) == value
+            assert loaded.__fspath__() == value
+            assert repr(loaded) == repr(pathlike)
 
-    def text_with_surrogateescape(p):
-        p = fspath(p)
-        if not isinstance(p, text_type):
-            return False
 
-        try:
-            p.encode(encoding)
-        except UnicodeEncodeError:
-            p.encode(encoding, 'surrogateescape')
-            return True
-        else:
-            return False
+# The predicates below get called for every example of a search, so bind
+# the globals they use as default arguments for faster local lookups, and
+# only call fspath() for values which aren't paths already.
 
-    fspaths().filter(text_with_surrogateescape).example()
+def text_with_surrogateescape(p, _enc=encoding, _text=text_type,
+                              _types=_PATH_TYPES, _fspath=fspath):
+    if not isinstance(p, _types):
+        p = _fspath(p)
+    if not isinstance(p, _text):
+        return False
 
+    try:
+        p.encode(_enc)
+    except UnicodeEncodeError:
+        p.encode(_enc, 'surrogateescape')
+        return True
+    else:
+        return False
 
-@pytest.mark.skipif(not is_win or not PY3, reason='PY3+Windows only')
-def test_find_text_with_surrogatepass():
-    # Windows str paths should contain surrogates at some point
 
-    def text_with_surrogatepass(p):
-        p = fspath(p)
-        if not isinstance(p, text_type):
-            return False
+def text_with_surrogatepass(p, _text=text_type, _types=_PATH_TYPES,
+                            _fspath=fspath):
+    if not isinstance(p, _types):
+        p = _fspath(p)
+    if not isinstance(p, _text):
+        return False
 
-        try:
-            p.encode('utf-8')
-        except UnicodeEncodeError:
-            p.encode('utf-8', 'surrogatepass')
-            return True
-        else:
-            return False
+    try:
+        p.encode('utf-8')
+    except UnicodeEncodeError:
+        p.encode('utf-8', 'surrogatepass')
+        return True
+    else:
+        return False
 
-    fspaths().filter(text_with_surrogatepass).example()
 
+def bytes_has_non_decodable(p, _enc=encoding, _bytes=bytes,
+                            _types=_PATH_TYPES, _fspath=fspath):
+    if not isinstance(p, _types):
+        p = _fspath(p)
+    if not isinstance(p, _bytes):
+        return False
 
-@pytest.mark.skipif(single_byte_full_encoding(encoding) or is_win,
-                    reason='Unix+UTF-8 only')
-def test_find_bytes_has_non_decodable():
-    # In case the encoding doesn't accept all input it should fail
-    # to decode binary paths on Unix at some point.
+    try:
+        p.decode(_enc)
+    except UnicodeDecodeError:
+        return True
+    return False
 
-    def bytes_has_non_decodable(p):
-        p = fspath(p)
-        if not isinstance(p, bytes):
-            return False
 
-        try:
-            p.decode(encoding)
-        except UnicodeDecodeError:
-            return True
+def text_surrogates_merge_in_bytes_form(p, _enc=encoding, _text=text_type,
+                                        _types=_PATH_TYPES, _fspath=fspath):
+    if not isinstance(p, _types):
+        p = _fspath(p)
+    if not isinstance(p, _text):
         return False
 
-    fspaths().filter(bytes_has_non_decodable).example()
-
+    return p.encode(_enc, 'surrogateescape').decode(
+        _enc, 'surrogateescape') != p
 
-@pytest.mark.skipif(
-    is_win or not PY3 or norm_encoding('utf-8') != norm_encoding(encoding),
-    reason='PY3+Unix+UTF-8 only')
-def test_find_text_surrogates_merge_in_bytes_form():
-    # These values can happen when two paths get concatenated under Unix.
-    # os.listdir() will never return them, but open() will accept them.
 
-    def text_surrogates_merge_in_bytes_form(p):
-        p = fspath(p)
-        if not isinstance(p, text_type):
-            return False
+def text_contains_unmerged_surrogates_pairs(p, _text=text_type,
+                                            _types=_PATH_TYPES,
+                                            _fspath=fspath):
+    if not isinstance(p, _types):
+        p = _fspath(p)
+    if not isinstance(p, _text):
+        return False
 
-        return p.encode(encoding, 'surrogateescape').decode(
-            encoding, 'surrogateescape') != p
+    return p.encode('utf-16-le', 'surrogatepass').decode(
+        'utf-16-le', 'surrogatepass') != p
 
-    fspaths().filter(
-        text_surrogates_merge_in_bytes_form).example()
 
+_FS_ENC_NAME = norm_encoding(encoding)
+_UTF8_NAME = norm_encoding('utf-8')
+_SBFE = single_byte_full_encoding(encoding)
 
+has_surrogateescape = not is_win and PY3
+has_surrogatepass = is_win and PY3
+has_non_decodable = not is_win and not _SBFE
+has_merging_surrogates = not is_win and PY3 and _UTF8_NAME == _FS_ENC_NAME
 # utf-16 + surrogatepass is broken with <= Python 3.3, just skip it there.
-@pytest.mark.skipif(not is_win or not PY3 or sys.version_info[:2] == (3, 3),
-                    reason='PY3+Win only (PY3.3 broken)')
-def test_text_contains_unmerged_surrogates_pairs():
-    # These values can happen if two paths get concatenated on Windows.
-    # os.listdir() will never return them, but open() will accept them.
+has_unmerged_surrogate_pairs = \
+    is_win and PY3 and sys.version_info[:2] != (3, 3)
 
-    def text_contains_unmerged_surrogates_pairs(p):
-        p = fspath(p)
-        if not isinstance(p, text_type):
-            return False
 
-        return p.encode('utf-16-le', 'surrogatepass').decode(
-            'utf-16-le', 'surrogatepass') != p
+# The following tests only check the predicates against known values.
+# test_find_edge_cases() is the one making sure fspaths() generates them.
 
-    fspaths().filter(
-        text_contains_unmerged_surrogates_pairs).example()
+@pytest.mark.skipif(not has_surrogateescape, reason='PY3+Unix only')
+def test_predicate_text_with_surrogateescape():
+    # Python 3 str paths on Unix should contain surrogates due to the
+    # surrogateescape handler at some point
+    assert text_with_surrogateescape(u'\udc80')
+    assert not text_with_surrogateescape(u'a')
+
+
+@pytest.mark.skipif(not has_surrogatepass, reason='PY3+Windows only')
+def test_predicate_text_with_surrogatepass():
+    # Windows str paths should contain surrogates at some point
+    assert text_with_surrogatepass(u'\ud800')
+    assert not text_with_surrogatepass(u'a')
+
+
+def non_decodable_byte(encoding):
+    """Returns the first single byte the encoding can't decode, or None"""
+
+    for i in range(len(_ALL_BYTES)):
+        byte = _ALL_BYTES[i:i + 1]
+        try:
+            byte.decode(encoding)
+        except UnicodeDecodeError:
+            return byte
+    return None
+
+
+@pytest.mark.skipif(not has_non_decodable, reason='Unix+UTF-8 only')
+def test_predicate_bytes_has_non_decodable():
+    # In case the encoding doesn't accept all input it should fail
+    # to decode binary paths on Unix at some point.
+    byte = non_decodable_byte(encoding)
+    assert byte is not None
+    assert bytes_has_non_decodable(byte)
+    assert not bytes_has_non_decodable(b'a')
+
+
+@pytest.mark.skipif(not has_merging_surrogates, reason='PY3+Unix+UTF-8 only')
+def test_predicate_text_surrogates_merge_in_bytes_form():
+    # These values can happen when two paths get concatenated under Unix.
+    # os.listdir() will never return them, but open() will accept them.
+    assert text_surrogates_merge_in_bytes_form(u'\udcc3\udca4')
+    assert not text_surrogates_merge_in_bytes_form(u'\udcc3')
+
+
+@pytest.mark.skipif(not has_unmerged_surrogate_pairs,
+                    reason='PY3+Win only (PY3.3 broken)')
+def test_predicate_text_contains_unmerged_surrogates_pairs():
+    # These values can happen if two paths get concatenated on Windows.
+    # os.listdir() will never return them, but open() will accept them.
+    assert text_contains_unmerged_surrogates_pairs(u'\ud800\udc00')
+    assert not text_contains_unmerged_surrogates_pairs(u'\ud800')
+
+
+def test_find_edge_cases():
+    # fspaths() should generate all the edge cases above at some point
+    predicates = []
+    if has_surrogateescape:
+        predicates.append(text_with_surrogateescape)
+    if has_surrogatepass:
+        predicates.append(text_with_surrogatepass)
+    if has_non_decodable:
+        predicates.append(bytes_has_non_decodable)
+    if has_merging_surrogates:
+        predicates.append(text_surrogates_merge_in_bytes_form)
+    if has_unmerged_surrogate_pairs:
+        predicates.append(text_contains_unmerged_surrogates_pairs)
+
+    _assert_covers(fspaths(), predicates)